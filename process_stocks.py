@@ -7,10 +7,16 @@ Runs every Friday at 4:05 PM EST
 """
 
 import os
-import json
-import requests
 import time
+import random
+import asyncio
+import aiohttp
+import orjson
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
 
@@ -18,328 +24,707 @@ from typing import Dict, List, Any, Optional, Tuple
 API_KEY = os.environ.get('POLYGON_API_KEY')
 BASE_URL = 'https://api.polygon.io'
 
-def get_all_tickers() -> List[str]:
-    """Fetch all common stock tickers from Polygon, paginated"""
-    print("Fetching all common stock tickers from Polygon...")
-    all_tickers = []
-    next_url = f"{BASE_URL}/v3/reference/tickers"
+# RS periods in approximate trading days
+RETURN_PERIODS = {
+    '3m': 63,   # ~3 months
+    '6m': 126,  # ~6 months
+    '9m': 189,  # ~9 months
+    '12m': 252  # ~12 months
+}
+MIN_LISTING_DAYS = 380  # calendar days needed for 252 trading days, plus a buffer
+
+# Compact per-ticker daily bar storage (timestamp ms, close, volume)
+BAR_DTYPE = np.dtype([('t', 'i8'), ('c', 'f8'), ('v', 'f8')])
+DAY_MS = 24 * 3600 * 1000
+# Bar timestamps are ET session times: midnight for /v2/aggs/ticker, the 16:00 close for grouped daily.
+# Shifting back 4 hours puts both on their ET date under EST and EDT.
+TRADING_DATE_SHIFT_MS = 4 * 3600 * 1000
+
+# Concurrency limits for the per-day / per-ticker fan-out
+MAX_CONCURRENCY = 20
+CONNECTION_LIMIT = 50
+CONNECTION_LIMIT_PER_HOST = 20
+KEEPALIVE_TIMEOUT = 60  # seconds an idle pooled connection is kept open between phases
+DNS_CACHE_TTL = 300
+REQUEST_TIMEOUT = 10  # seconds to connect / between reads, so one stalled ticker can't hang a gather
+
+# Rate limiting (token bucket shared by every request)
+REQUESTS_PER_SECOND = 5  # Polygon Starter plan limit
+RATE_LIMIT_BURST = 5
+MIN_REQUESTS_PER_SECOND = 1  # floor when repeated 429s halve the rate
+RATE_RECOVERY_STEP = 0.5  # requests/sec regained per successful call, back up to REQUESTS_PER_SECOND
+
+# Retry policy for throttled (429) / transient server and network failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+BACKOFF_JITTER = 0.5
+
+# Paginated listings are split into ranges fetched concurrently, since each
+# next_url cursor is only known once the previous page has arrived
+TICKER_SHARDS = ['C', 'F', 'J', 'M', 'P', 'S', 'V']  # ticker.lt/ticker.gte boundaries
+IPO_SHARDS = 4  # listing-date windows across the 2-year lookback
+
+# On-disk cache (restored between workflow runs by actions/cache)
+CACHE_DIR = '.cache'
+GROUPED_CACHE_DIR = os.path.join(CACHE_DIR, 'grouped')
+TICKERS_CACHE_TTL = 6 * 24 * 3600  # seconds; under the weekly schedule so each Friday run refetches (past days never expire)
+IPO_LISTING_CACHE_TTL = 3600  # seconds; new IPOs appear intraday, so only reruns within the hour reuse it
+GROUPED_SCHEMA = pa.schema([
+    ('T', pa.string()),
+    ('t', pa.int64()),
+    ('o', pa.float64()),
+    ('h', pa.float64()),
+    ('l', pa.float64()),
+    ('c', pa.float64()),
+    ('v', pa.float64())
+])
+CACHE_STATS = {'hits': 0, 'misses': 0}
+
+# historical_data.parquet: one row per (symbol, day), SPY first, then each ranked stock in order
+HISTORY_PATH = 'historical_data.parquet'
+HISTORY_SCHEMA = pa.schema([
+    ('s', pa.string()),
+    ('t', pa.int64()),
+    ('o', pa.float64()),
+    ('h', pa.float64()),
+    ('l', pa.float64()),
+    ('c', pa.float64()),
+    ('v', pa.float64()),
+    ('u', pa.string()),
+    ('i', pa.string())
+])
+HISTORY_DELTA_PATH = 'historical_delta.jsonl'  # daily bars logged since this rebuild, see process_stocks_daily.py
+
+class TokenBucket:
+    """Async token bucket that paces requests to a rolling requests/sec budget"""
+    
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_rate = refill_rate
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+    
+    async def acquire(self):
+        """Take one token, sleeping only when the bucket is empty"""
+        async with self.lock:
+            self._refill()
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.refill_rate
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+    
+    def drain(self):
+        """Empty the bucket, e.g. when the server reports no remaining quota"""
+        self.tokens = 0
+        self.last_refill = time.monotonic()
+    
+    def slow_down(self):
+        """Halve the refill rate after the server throttles a request"""
+        self._refill()
+        self.refill_rate = max(MIN_REQUESTS_PER_SECOND, self.refill_rate / 2)
+    
+    def speed_up(self):
+        """Creep back toward the configured rate after a successful request"""
+        self._refill()
+        self.refill_rate = min(self.max_rate, self.refill_rate + RATE_RECOVERY_STEP)
+
+RATE_LIMITER = TokenBucket(RATE_LIMIT_BURST, REQUESTS_PER_SECOND)
+
+def get_backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Seconds to wait before a retry: honor Retry-After, else exponential backoff with jitter"""
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, BACKOFF_JITTER)
+        except ValueError:
+            pass
+    return min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt) + random.uniform(0, BACKOFF_JITTER)
+
+async def fetch_json(session: aiohttp.ClientSession, url: str, params: Optional[Dict] = None) -> Dict:
+    """GET a Polygon endpoint through the rate limiter, retrying transient failures"""
+    for attempt in range(MAX_RETRIES + 1):
+        await RATE_LIMITER.acquire()
+        
+        try:
+            async with session.get(url, params=params) as response:
+                if response.headers.get('X-RateLimit-Remaining') == '0':
+                    RATE_LIMITER.drain()
+                
+                # Additive increase / multiplicative decrease keeps the pace just under the server's limit
+                if response.status == 429:
+                    RATE_LIMITER.slow_down()
+                
+                if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    response.raise_for_status()
+                    RATE_LIMITER.speed_up()
+                    # orjson parses large grouped-daily payloads several times faster than stdlib json
+                    return orjson.loads(await response.read())
+                
+                delay = get_backoff_delay(attempt, response.headers.get('Retry-After'))
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+            # Dropped connections and timeouts are safe to retry - every call is a GET
+            if attempt == MAX_RETRIES:
+                raise
+            delay = get_backoff_delay(attempt)
+        
+        await asyncio.sleep(delay)
+
+def load_cache(name: str, ttl: Optional[float] = None) -> Optional[Any]:
+    """Load a JSON cache entry, or None if it is missing or older than ttl seconds"""
+    path = os.path.join(CACHE_DIR, f"{name}.json")
+    try:
+        with open(path, 'rb') as f:
+            entry = orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
     
-    params = {
-        'market': 'stocks',
-        'type': 'CS',  # Common Stock only
-        'active': 'true',
-        'limit': 1000,
-        'apiKey': API_KEY
-    }
+    if ttl is not None and time.time() - entry['saved_at'] > ttl:
+        return None
+    
+    return entry['data']
+
+def save_cache(name: str, data: Any):
+    """Atomically write a JSON cache entry"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, f"{name}.json")
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(orjson.dumps({'saved_at': time.time(), 'data': data}))
+    os.replace(f"{path}.tmp", path)
+
+def load_cached_grouped(date: str) -> Optional[pa.Table]:
+    """Load a cached grouped-daily table, or None if the day is not cached"""
+    path = os.path.join(GROUPED_CACHE_DIR, f"{date}.parquet")
+    try:
+        return pq.read_table(path)
+    except (FileNotFoundError, OSError, pa.ArrowInvalid):
+        return None
+
+def save_cached_grouped(date: str, table: pa.Table):
+    """Atomically write a grouped-daily table to the Parquet cache"""
+    os.makedirs(GROUPED_CACHE_DIR, exist_ok=True)
+    path = os.path.join(GROUPED_CACHE_DIR, f"{date}.parquet")
+    pq.write_table(table, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+def prune_grouped_cache(start_date: str) -> int:
+    """Delete cached grouped days older than start_date so the cache doesn't grow every week"""
+    try:
+        names = os.listdir(GROUPED_CACHE_DIR)
+    except FileNotFoundError:
+        return 0
+    
+    # File names are ISO dates, so string order is date order
+    stale = [name for name in names if name.endswith('.parquet') and name[:-len('.parquet')] < start_date]
+    for name in stale:
+        os.remove(os.path.join(GROUPED_CACHE_DIR, name))
+    return len(stale)
+
+def get_grouped_cache_saved_at(dates: List[str]) -> Optional[float]:
+    """Earliest save time of the cached grouped-daily files for these dates, or None if none are cached"""
+    saved_at = []
+    for date in dates:
+        try:
+            saved_at.append(os.path.getmtime(os.path.join(GROUPED_CACHE_DIR, f"{date}.parquet")))
+        except OSError:
+            continue
+    return min(saved_at) if saved_at else None
+
+async def fetch_all_pages(session: aiohttp.ClientSession, url: str, params: Dict, label: str) -> Tuple[List[Dict], bool]:
+    """Follow next_url cursors for one query, returning its results and whether every page arrived"""
+    results = []
+    next_url = url
     
     page = 1
     while next_url:
         try:
-            if page > 1:
-                response = requests.get(next_url)
-            else:
-                response = requests.get(next_url, params=params)
+            data = await fetch_json(session, next_url, params if page == 1 else None)
             
-            response.raise_for_status()
-            data = response.json()
-            
-            if 'results' in data:
-                tickers = [t['ticker'] for t in data['results']]
-                all_tickers.extend(tickers)
-                print(f"  Page {page}: Got {len(tickers)} tickers (Total: {len(all_tickers)})")
+            page_results = data.get('results') or []
+            results.extend(page_results)
+            print(f"  {label} page {page}: Got {len(page_results)} records")
             
             # Check for next page
             next_url = data.get('next_url')
-            if next_url:
+            if next_url and '?' in next_url:
                 next_url = f"{next_url}&apiKey={API_KEY}"
+            elif next_url:
+                next_url = f"{next_url}?apiKey={API_KEY}"
             
             page += 1
-            time.sleep(0.1)  # Rate limiting
             
         except Exception as e:
-            print(f"Error fetching tickers page {page}: {e}")
-            break
+            print(f"Error fetching {label} page {page}: {e}")
+            return results, False
+    
+    return results, True
+
+async def get_all_tickers(session: aiohttp.ClientSession) -> List[Dict]:
+    """Fetch all common stock tickers with list date and name from Polygon, one alphabetical shard per task"""
+    cached = load_cache('tickers', TICKERS_CACHE_TTL)
+    if isinstance(cached, list) and cached:
+        CACHE_STATS['hits'] += 1
+        print(f"✅ Loaded {len(cached)} tickers from cache")
+        return cached
+    
+    CACHE_STATS['misses'] += 1
+    print("Fetching all common stock tickers from Polygon...")
+    
+    params = {
+        'market': 'stocks',
+        'type': 'CS',  # Common Stock only
+        'active': 'true',
+        'limit': 1000,
+        'apiKey': API_KEY
+    }
+    
+    # First shard has no lower bound and last has no upper bound, so together they cover every ticker
+    bounds = [None] + TICKER_SHARDS + [None]
+    shards = []
+    for lower, upper in zip(bounds[:-1], bounds[1:]):
+        shard_params = dict(params)
+        if lower:
+            shard_params['ticker.gte'] = lower
+        if upper:
+            shard_params['ticker.lt'] = upper
+        shards.append(fetch_all_pages(session, f"{BASE_URL}/v3/reference/tickers", shard_params,
+                                      f"Tickers {lower or ''}-{upper or ''}"))
+    
+    pages = await asyncio.gather(*shards)
+    all_tickers = [
+        {'ticker': t['ticker'], 'list_date': t.get('list_date'), 'name': t.get('name')}
+        for results, _ in pages for t in results
+    ]
+    
+    # Only cache a complete listing so a failed page is retried next run
+    if all(complete for _, complete in pages) and all_tickers:
+        save_cache('tickers', all_tickers)
     
     print(f"✅ Total tickers fetched: {len(all_tickers)}")
     return all_tickers
 
-def get_recent_ipos() -> List[Dict]:
+async def get_recent_ipos(session: aiohttp.ClientSession) -> List[Dict]:
     """Fetch stocks that IPOed in the last 2 years using Massive IPO endpoint"""
     print("\n=== Fetching Recent IPOs (Last 2 Years) ===")
     
+    cached = load_cache('ipo_listing', IPO_LISTING_CACHE_TTL)
+    if isinstance(cached, list):
+        CACHE_STATS['hits'] += 1
+        print(f"✅ Loaded {len(cached)} IPOs from cache")
+        return cached
+    
+    CACHE_STATS['misses'] += 1
+    
     # Calculate date 2 years ago
     two_years_ago = datetime.now() - timedelta(days=730)
-    date_filter = two_years_ago.strftime('%Y-%m-%d')
-    
-    recent_ipos = []
-    next_url = f"https://api.massive.com/vX/reference/ipos"
     
     params = {
-        'listing_date_gte': date_filter,
         'limit': 1000,
         'apiKey': API_KEY
     }
     
-    page = 1
-    while next_url:
-        try:
-            if page > 1:
-                response = requests.get(next_url)
-            else:
-                response = requests.get(next_url, params=params)
-            
-            response.raise_for_status()
-            data = response.json()
-            
-            if 'results' in data and data['results']:
-                print(f"  Page {page}: Found {len(data['results'])} IPO records")
-                
-                for ipo_data in data['results']:
-                    # Get announced_date for IPO date
-                    announced = ipo_data.get('announced_date')
-                    if announced:
-                        # Verify date is within our range (2 years)
-                        try:
-                            ipo_date = datetime.strptime(announced, '%Y-%m-%d')
-                            days_ago = (datetime.now() - ipo_date).days
-                            
-                            # Only include if truly within 2 years
-                            if 0 <= days_ago <= 730:
-                                recent_ipos.append({
-                                    'ticker': ipo_data.get('ticker'),
-                                    'name': ipo_data.get('issuer_name', 'N/A'),
-                                    'list_date': announced,
-                                    'ipo_price': ipo_data.get('final_issue_price'),
-                                    'ipo_status': ipo_data.get('ipo_status', 'unknown')
-                                })
-                        except (ValueError, TypeError):
-                            continue
-            
-            next_url = data.get('next_url')
-            if next_url and '?' in next_url:
-                next_url = f"{next_url}&apiKey={API_KEY}"
-            elif next_url:
-                next_url = f"{next_url}?apiKey={API_KEY}"
-            
-            page += 1
-            time.sleep(0.1)
+    # Split the lookback into listing-date windows; the last one is open-ended
+    window = timedelta(days=730 // IPO_SHARDS)
+    shards = []
+    for i in range(IPO_SHARDS):
+        shard_params = dict(params)
+        shard_params['listing_date.gte'] = (two_years_ago + i * window).strftime('%Y-%m-%d')
+        if i < IPO_SHARDS - 1:
+            shard_params['listing_date.lt'] = (two_years_ago + (i + 1) * window).strftime('%Y-%m-%d')
+        shards.append(fetch_all_pages(session, "https://api.massive.com/vX/reference/ipos", shard_params,
+                                      f"IPOs from {shard_params['listing_date.gte']}"))
+    
+    pages = await asyncio.gather(*shards)
+    
+    recent_ipos = []
+    seen = set()
+    for results, _ in pages:
+        for ipo_data in results:
+            # Shard windows shouldn't overlap, but never publish a ticker twice
+            ticker = ipo_data.get('ticker')
+            if ticker in seen:
+                continue
             
-        except Exception as e:
-            print(f"Error fetching recent IPOs page {page}: {e}")
-            break
+            # Get announced_date for IPO date
+            announced = ipo_data.get('announced_date')
+            if announced:
+                # Verify date is within our range (2 years)
+                try:
+                    ipo_date = datetime.strptime(announced, '%Y-%m-%d')
+                    days_ago = (datetime.now() - ipo_date).days
+                    
+                    # Only include if truly within 2 years
+                    if 0 <= days_ago <= 730:
+                        seen.add(ticker)
+                        recent_ipos.append({
+                            'ticker': ticker,
+                            'name': ipo_data.get('issuer_name', 'N/A'),
+                            'list_date': announced,
+                            'ipo_price': ipo_data.get('final_issue_price'),
+                            'ipo_status': ipo_data.get('ipo_status', 'unknown')
+                        })
+                except (ValueError, TypeError):
+                    continue
+    
+    # Only cache a complete scan so a failed page is retried next run
+    if all(complete for _, complete in pages):
+        save_cache('ipo_listing', recent_ipos)
     
     print(f"✅ Found {len(recent_ipos)} IPOs in last 2 years (all statuses)")
     return recent_ipos
 
-def get_current_price_and_volume(ticker: str) -> Optional[Dict]:
-    """Get current price and recent volume for a ticker"""
+async def get_recent_bars(session: aiohttp.ClientSession, tickers: List[str]) -> Dict[str, List[Dict]]:
+    """Get the last 10 days of bars for many tickers, newest first, from one grouped-daily call per day"""
+    end_date = datetime.now().strftime('%Y-%m-%d')
+    start_date = (datetime.now() - timedelta(days=10)).strftime('%Y-%m-%d')
+    
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    days = await asyncio.gather(*[
+        get_grouped_daily(session, semaphore, date)
+        for date in get_trading_days(start_date, end_date)
+    ])
+    
+    wanted = pa.array(tickers, pa.string())
+    bars_by_ticker = defaultdict(list)
+    for table in reversed(days):
+        if table is None:
+            continue
+        for row in select_tickers(table, wanted).to_pylist():
+            bars_by_ticker[row['T']].append(row)
+    
+    return bars_by_ticker
+
+def get_current_price_and_volume(bars: List[Dict]) -> Optional[Dict]:
+    """Get current price and recent volume from a ticker's recent bars (newest first)"""
+    if not bars:
+        return None
+    
+    current_price = bars[0]['c']  # Most recent close
+    volumes = [bar['v'] for bar in bars]
+    avg_volume = np.mean(volumes) if volumes else 0
+    
+    # Try to get IPO price (first day's open)
+    ipo_price = bars[-1]['o'] if len(bars) > 0 else None
+    
+    return {
+        'current_price': current_price,
+        'avg_volume': int(avg_volume),
+        'ipo_price': ipo_price,
+        'has_data': True
+    }
+
+def process_single_ipo(ipo: Dict, bars: List[Dict]) -> Optional[Dict]:
+    """Build current price and stats for a single recent IPO"""
+    ticker = ipo['ticker']
+    
     try:
-        # Get last 5 days of data to calculate average volume and current price
-        end_date = datetime.now().strftime('%Y-%m-%d')
-        start_date = (datetime.now() - timedelta(days=10)).strftime('%Y-%m-%d')
-        
-        url = f"{BASE_URL}/v2/aggs/ticker/{ticker}/range/1/day/{start_date}/{end_date}"
-        params = {
-            'adjusted': 'true',
-            'sort': 'desc',
-            'limit': 10,
-            'apiKey': API_KEY
-        }
-        
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        # Skip if list_date is None or invalid
+        if not ipo.get('list_date'):
+            return None
         
-        if data.get('results'):
-            bars = data['results']
-            current_price = bars[0]['c']  # Most recent close
-            volumes = [bar['v'] for bar in bars]
-            avg_volume = np.mean(volumes) if volumes else 0
-            
-            # Try to get IPO price (first day's open)
-            ipo_price = bars[-1]['o'] if len(bars) > 0 else None
-            
-            return {
-                'current_price': current_price,
-                'avg_volume': int(avg_volume),
-                'ipo_price': ipo_price,
-                'has_data': True
-            }
-        
-        return None
+        # Verify the date format
+        try:
+            ipo_date = datetime.strptime(ipo['list_date'], '%Y-%m-%d')
+        except (ValueError, TypeError):
+            return None
+        
+        days_since_ipo = (datetime.now() - ipo_date).days
+        
+        # Get current price and volume
+        price_data = get_current_price_and_volume(bars)
+        
+        # Only include if we can actually get price data (means it's trading)
+        if not price_data or not price_data['has_data']:
+            return None
+        
+        # Calculate percent change from IPO if we have IPO price
+        percent_from_ipo = None
+        if price_data.get('ipo_price'):
+            percent_from_ipo = ((price_data['current_price'] - price_data['ipo_price']) / price_data['ipo_price']) * 100
+        
+        return {
+            'symbol': ticker,
+            'company_name': ipo['name'],
+            'ipo_date': ipo['list_date'],
+            'days_since_ipo': days_since_ipo,
+            'current_price': round(price_data['current_price'], 2),
+            'ipo_price': round(price_data['ipo_price'], 2) if price_data.get('ipo_price') else None,
+            'percent_from_ipo': round(percent_from_ipo, 1) if percent_from_ipo is not None else None,
+            'avg_volume': format_volume(price_data['avg_volume']),
+            'raw_volume': price_data['avg_volume']
+        }
         
     except Exception as e:
+        print(f"  Error processing {ticker}: {e}")
         return None
 
-def process_recent_ipos(recent_ipos: List[Dict]) -> List[Dict]:
+async def process_recent_ipos(session: aiohttp.ClientSession, recent_ipos: List[Dict]) -> List[Dict]:
     """Process recent IPO data to get current prices and stats"""
     print("\nProcessing recent IPO data...")
     
-    processed_ipos = []
+    # One grouped-daily call per day covers every IPO, instead of one aggs call per IPO
+    bars_by_ticker = await get_recent_bars(session, [ipo['ticker'] for ipo in recent_ipos])
     
-    for i, ipo in enumerate(recent_ipos):
-        ticker = ipo['ticker']
-        
+    results = [process_single_ipo(ipo, bars_by_ticker.get(ipo['ticker'], [])) for ipo in recent_ipos]
+    processed_ipos = [ipo for ipo in results if ipo is not None]
+    
+    print(f"✅ Processed {len(processed_ipos)} recent IPOs with data")
+    return processed_ipos
+
+def get_trading_days(start_date: str, end_date: str) -> List[str]:
+    """List weekdays in a date range (market holidays come back empty from Polygon)"""
+    days = []
+    day = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    
+    while day <= end:
+        if day.weekday() < 5:
+            days.append(day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+    
+    return days
+
+async def get_grouped_daily(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, date: str) -> Optional[pa.Table]:
+    """Fetch every US stock's daily bar for one date (cached once the day has closed)"""
+    cached = load_cached_grouped(date)
+    if cached is not None:
+        CACHE_STATS['hits'] += 1
+        return cached
+    
+    CACHE_STATS['misses'] += 1
+    async with semaphore:
         try:
-            if i % 20 == 0:
-                print(f"  Progress: {i}/{len(recent_ipos)}")
-            
-            # Skip if list_date is None or invalid
-            if not ipo.get('list_date'):
-                continue
-            
-            # Verify the date format
-            try:
-                ipo_date = datetime.strptime(ipo['list_date'], '%Y-%m-%d')
-            except (ValueError, TypeError):
-                continue
+            url = f"{BASE_URL}/v2/aggs/grouped/locale/us/market/stocks/{date}"
+            params = {'adjusted': 'true', 'apiKey': API_KEY}
             
-            days_since_ipo = (datetime.now() - ipo_date).days
+            data = await fetch_json(session, url, params)
+            table = pa.Table.from_pylist(data.get('results') or [], schema=GROUPED_SCHEMA)
             
-            # Get current price and volume
-            price_data = get_current_price_and_volume(ticker)
-            
-            # Only include if we can actually get price data (means it's trading)
-            if price_data and price_data['has_data']:
-                # Calculate percent change from IPO if we have IPO price
-                percent_from_ipo = None
-                if price_data.get('ipo_price'):
-                    percent_from_ipo = ((price_data['current_price'] - price_data['ipo_price']) / price_data['ipo_price']) * 100
-                
-                processed_ipos.append({
-                    'symbol': ticker,
-                    'company_name': ipo['name'],
-                    'ipo_date': ipo['list_date'],
-                    'days_since_ipo': days_since_ipo,
-                    'current_price': round(price_data['current_price'], 2),
-                    'ipo_price': round(price_data['ipo_price'], 2) if price_data.get('ipo_price') else None,
-                    'percent_from_ipo': round(percent_from_ipo, 1) if percent_from_ipo is not None else None,
-                    'avg_volume': format_volume(price_data['avg_volume']),
-                    'raw_volume': price_data['avg_volume']
-                })
-            
-            time.sleep(0.5)  # Rate limiting
+            # Today's bars may still change, so only cache finished days
+            if date < datetime.now().strftime('%Y-%m-%d'):
+                save_cached_grouped(date, table)
             
+            return table
         except Exception as e:
-            print(f"  Error processing {ticker}: {e}")
-            continue
-    
-    print(f"✅ Processed {len(processed_ipos)} recent IPOs with data")
-    return processed_ipos
+            print(f"  Error fetching grouped daily bars for {date}: {e}")
+            return None
 
-def get_ipo_date(ticker: str) -> Optional[str]:
-    """Get IPO date from Polygon ticker details"""
-    try:
-        url = f"{BASE_URL}/v3/reference/tickers/{ticker}"
-        params = {'apiKey': API_KEY}
-        
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        if 'results' in data and 'list_date' in data['results']:
-            return data['results']['list_date']
-        
-        return None
-    except:
-        return None
+def select_tickers(table: pa.Table, wanted: pa.Array) -> pa.Table:
+    """Keep only the grouped-daily rows for the wanted tickers"""
+    return table.filter(pc.is_in(table['T'], value_set=wanted))
 
-def get_stock_data(ticker: str, start_date: str, end_date: str) -> List[Dict]:
-    """Fetch historical daily bars for a ticker"""
-    try:
-        url = f"{BASE_URL}/v2/aggs/ticker/{ticker}/range/1/day/{start_date}/{end_date}"
-        params = {
-            'adjusted': 'true',
-            'sort': 'asc',
-            'limit': 50000,
-            'apiKey': API_KEY
-        }
-        
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data.get('results'):
-            return data['results']
-        
-        return []
-    except Exception as e:
-        print(f"  Error fetching data for {ticker}: {e}")
-        return []
+def split_bars_by_ticker(rows: pa.Table) -> Dict[str, np.ndarray]:
+    """Turn grouped-daily rows into one date-ordered BAR_DTYPE array per ticker, column by column"""
+    rows = rows.take(pc.sort_indices(rows, sort_keys=[('T', 'ascending'), ('t', 'ascending')]))
+    
+    bars = np.empty(rows.num_rows, dtype=BAR_DTYPE)
+    for name in BAR_DTYPE.names:
+        bars[name] = rows[name].to_numpy()
+    
+    symbols = rows['T'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]]) if len(symbols) else np.empty(0, dtype=np.int64)
+    return dict(zip(symbols[starts].tolist(), np.split(bars, starts[1:])))
 
-def get_sp500_benchmark(start_date: str, end_date: str) -> List[Dict]:
-    """Fetch S&P 500 (SPY) benchmark data"""
-    print("Fetching S&P 500 benchmark data (SPY)...")
-    return get_stock_data('SPY', start_date, end_date)
+async def get_wanted_rows(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, date: str,
+                          wanted: pa.Array) -> Optional[pa.Table]:
+    """Fetch one grouped day and keep only the wanted tickers' t/c/v columns, so the full day isn't held"""
+    table = await get_grouped_daily(session, semaphore, date)
+    return None if table is None else select_tickers(table, wanted).select(['T', 't', 'c', 'v'])
 
-def calculate_return(prices: List[Dict], days_back: int) -> Optional[float]:
-    """Calculate return over a specific period"""
-    if len(prices) < days_back:
+async def get_grouped_bars(session: aiohttp.ClientSession, start_date: str, end_date: str,
+                           tickers: List[str]) -> Optional[Dict[str, np.ndarray]]:
+    """Build each ticker's daily history from one grouped-daily call per trading day"""
+    trading_days = get_trading_days(start_date, end_date)
+    print(f"Fetching grouped daily bars for {len(trading_days)} trading days...")
+    
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    wanted = pa.array(tickers, pa.string())
+    days = await asyncio.gather(*[get_wanted_rows(session, semaphore, date, wanted) for date in trading_days])
+    
+    # A missing day would shift every ticker's returns, so fail the whole run
+    if any(rows is None for rows in days):
         return None
     
-    end_price = prices[-1]['c']
-    start_price = prices[-days_back]['c']
+    return split_bars_by_ticker(pa.concat_tables(days))
+
+async def get_ticker_bars(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, ticker: str,
+                          start_date: str, end_date: str) -> Optional[pa.Table]:
+    """Fetch one ticker's split-adjusted daily history from the aggs endpoint, as grouped-daily rows"""
+    async with semaphore:
+        try:
+            url = f"{BASE_URL}/v2/aggs/ticker/{ticker}/range/1/day/{start_date}/{end_date}"
+            params = {'adjusted': 'true', 'sort': 'asc', 'limit': 50000, 'apiKey': API_KEY}
+            
+            data = await fetch_json(session, url, params)
+            return pa.Table.from_pylist([{'T': ticker, **bar} for bar in data.get('results') or []],
+                                        schema=GROUPED_SCHEMA)
+        except Exception as e:
+            print(f"  Error fetching bars for {ticker}: {e}")
+            return None
+
+def patch_cached_grouped(adjusted: pa.Table, tickers: List[str]):
+    """Replace these tickers' rows in every cached grouped day with their split-adjusted bars"""
+    replaced = pa.array(tickers, pa.string())
+    adjusted_days = to_trading_dates(adjusted['t'].to_numpy())
     
-    return (end_price - start_price) / start_price
+    for name in sorted(os.listdir(GROUPED_CACHE_DIR)):
+        if not name.endswith('.parquet'):
+            continue
+        date = name[:-len('.parquet')]
+        table = load_cached_grouped(date)
+        if table is None:
+            continue
+        
+        kept = table.filter(pc.invert(pc.is_in(table['T'], value_set=replaced)))
+        day_rows = adjusted.filter(pa.array(adjusted_days == np.datetime64(date, 'D').astype(np.int64)))
+        save_cached_grouped(date, pa.concat_tables([kept, day_rows]))
 
-def calculate_aligned_returns(stock_prices: List[Dict], sp500_prices: List[Dict]) -> Tuple[Optional[Dict], Optional[Dict], float]:
-    """Calculate returns aligned with S&P 500 benchmark"""
-    if not stock_prices or not sp500_prices:
-        return None, None, 0
+async def refresh_split_tickers(session: aiohttp.ClientSession, tickers: List[str], start_date: str,
+                                end_date: str, cached_since: Optional[float]) -> bool:
+    """Rewrite cached grouped days for tickers that split since the last check (cached prices are pre-split)
     
-    # Need at least 252 trading days (roughly 12 months)
-    if len(stock_prices) < 252:
-        return None, None, 0
+    The check runs from the date saved by the previous successful check, so each split is refetched once.
+    """
+    if cached_since is None:
+        # Nothing cached yet, so every day fetched from here on is already adjusted
+        save_cache('split_check', end_date)
+        return True
+    
+    checked_through = load_cache('split_check')
+    params = {'execution_date.lte': end_date, 'limit': 1000, 'apiKey': API_KEY}
+    if checked_through:
+        params['execution_date.gt'] = checked_through
+    else:
+        params['execution_date.gte'] = datetime.fromtimestamp(cached_since).strftime('%Y-%m-%d')
     
-    # Calculate periods (approximate trading days)
-    periods = {
-        '3m': 63,   # ~3 months
-        '6m': 126,  # ~6 months
-        '9m': 189,  # ~9 months
-        '12m': 252  # ~12 months
-    }
+    splits, complete = await fetch_all_pages(session, f"{BASE_URL}/v3/reference/splits", params, "Splits")
+    if not complete:
+        return False
     
-    stock_returns = {}
-    sp500_returns = {}
-    relative_returns = {}
+    wanted = set(tickers)
+    affected = sorted({split['ticker'] for split in splits if split.get('ticker') in wanted})
+    if affected:
+        print(f"Refetching {len(affected)} tickers with splits since the last check...")
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        histories = await asyncio.gather(*[
+            get_ticker_bars(session, semaphore, ticker, start_date, end_date) for ticker in affected
+        ])
+        
+        # Unadjusted history would produce bogus returns, so leave the watermark for a retry next run
+        if any(bars is None for bars in histories):
+            return False
+        
+        patch_cached_grouped(pa.concat_tables(histories), affected)
     
-    for period_name, days in periods.items():
-        stock_ret = calculate_return(stock_prices, days)
-        sp500_ret = calculate_return(sp500_prices, days)
+    save_cache('split_check', end_date)
+    return True
+
+def has_enough_history(list_date: Optional[str], today: datetime) -> bool:
+    """Whether a ticker listed on list_date can have 12 months of bars (unknown dates pass)"""
+    if not list_date:
+        return True
+    
+    try:
+        return (today - datetime.strptime(list_date, '%Y-%m-%d')).days >= MIN_LISTING_DAYS
+    except (ValueError, TypeError):
+        return True
+
+def to_trading_dates(timestamps: np.ndarray) -> np.ndarray:
+    """Map bar timestamps (ms) to ET trading dates as days since the epoch"""
+    return (timestamps - TRADING_DATE_SHIFT_MS) // DAY_MS
+
+def build_price_matrix(bars_by_ticker: Dict[str, np.ndarray], tickers: List[str],
+                       sp500_data: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Stack closes and volumes into (n_tickers, n_days) arrays aligned on SPY's trading days
+    
+    Days a ticker did not trade are NaN. Also returns each ticker's bar count.
+    """
+    # Match on trading date, since aggs and grouped-daily bars stamp the same day differently
+    trading_days = to_trading_dates(sp500_data['t'])
+    closes = np.full((len(tickers), len(trading_days)), np.nan)
+    volumes = np.full((len(tickers), len(trading_days)), np.nan)
+    bar_counts = np.zeros(len(tickers), dtype=np.int64)
+    
+    for i, ticker in enumerate(tickers):
+        bars = bars_by_ticker.get(ticker)
+        if bars is None:
+            continue
         
-        if stock_ret is not None and sp500_ret is not None:
-            stock_returns[period_name] = stock_ret
-            sp500_returns[period_name] = sp500_ret
-            relative_returns[period_name] = stock_ret - sp500_ret
-        else:
-            stock_returns[period_name] = 0
-            sp500_returns[period_name] = 0
-            relative_returns[period_name] = 0
+        # Drop bars on days SPY has no bar for, then place the rest by date
+        bar_days = to_trading_dates(bars['t'])
+        columns = np.minimum(np.searchsorted(trading_days, bar_days), len(trading_days) - 1)
+        on_trading_day = trading_days[columns] == bar_days
+        closes[i, columns[on_trading_day]] = bars['c'][on_trading_day]
+        volumes[i, columns[on_trading_day]] = bars['v'][on_trading_day]
+        bar_counts[i] = np.count_nonzero(on_trading_day)
     
-    # Calculate average volume over last 50 days
-    recent_prices = stock_prices[-50:] if len(stock_prices) >= 50 else stock_prices
-    volumes = [p['v'] for p in recent_prices if 'v' in p]
-    avg_volume = np.mean(volumes) if volumes else 0
+    return closes, volumes, bar_counts
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """Carry the last non-NaN value forward along each row"""
+    index = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(index, axis=1, out=index)
+    return values[np.arange(values.shape[0])[:, np.newaxis], index]
+
+def calculate_period_returns(closes: np.ndarray) -> Dict[str, np.ndarray]:
+    """Calculate returns over every RS period (approximate trading days)
     
-    return relative_returns, stock_returns, avg_volume
+    Works on a single close series (scalar returns) or a matrix (one return per row).
+    """
+    return {
+        period_name: (closes[..., -1] - closes[..., -days]) / closes[..., -days]
+        for period_name, days in RETURN_PERIODS.items()
+    }
 
-def calculate_ibd_rs_score(relative_returns: Dict) -> float:
-    """Calculate IBD-style RS score using the discovered formula
+def calculate_ibd_rs_scores(relative_returns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Calculate IBD-style RS scores using the discovered formula
     
     Formula: RS = 2×(3-month relative) + (6-month relative) + (9-month relative) + (12-month relative)
     Where relative = (stock return - S&P 500 return)
     """
-    if not relative_returns:
-        return 0
-    
-    rs_score = (
-        2 * relative_returns.get('3m', 0) +
-        1 * relative_returns.get('6m', 0) +
-        1 * relative_returns.get('9m', 0) +
-        1 * relative_returns.get('12m', 0)
+    return (
+        2 * relative_returns['3m'] +
+        relative_returns['6m'] +
+        relative_returns['9m'] +
+        relative_returns['12m']
     )
+
+def calculate_average_volumes(volumes: np.ndarray, days: int = 50) -> np.ndarray:
+    """Average volume over the last N trading days, ignoring days without a bar"""
+    recent = volumes[:, -days:]
+    counts = np.count_nonzero(~np.isnan(recent), axis=1)
+    return np.nansum(recent, axis=1) / np.maximum(counts, 1)
+
+def calculate_relative_strength(closes: np.ndarray, volumes: np.ndarray, sp500_closes: np.ndarray
+                                ) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray], np.ndarray, np.ndarray]:
+    """Calculate relative returns, stock returns, RS scores and average volumes for every row"""
+    # Benchmark returns are the same for every ticker, so compute them once as scalars
+    sp500_returns = calculate_period_returns(sp500_closes)
+    stock_returns = calculate_period_returns(forward_fill(closes))
+    relative_returns = {
+        period_name: stock_returns[period_name] - sp500_returns[period_name]
+        for period_name in RETURN_PERIODS
+    }
     
-    return rs_score
+    return relative_returns, stock_returns, calculate_ibd_rs_scores(relative_returns), calculate_average_volumes(volumes)
+
+def calculate_rs_ranks(rs_scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Rank RS scores as 1-99 percentiles; also returns the best-first ordering"""
+    total_stocks = len(rs_scores)
+    order = np.argsort(-rs_scores, kind='stable')
+    positions = np.empty(total_stocks, dtype=np.int64)
+    positions[order] = np.arange(total_stocks)
+    
+    percentiles = np.floor((total_stocks - positions) / total_stocks * 99).astype(np.int64) + 1
+    return order, np.minimum(percentiles, 99)
 
 def format_volume(volume: float) -> str:
     """Format volume as XXXk or XXXm"""
@@ -354,7 +739,59 @@ def format_return(return_val: float) -> str:
     """Format return as percentage"""
     return f"{return_val*100:.1f}%"
 
-def main():
+def split_minimal_history(stock_prices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Downsample a ticker's (or SPY's) bars into older every-5th-day closes and recent bars with volume"""
+    # Every 5th day for older data (excluding recent 30)
+    if len(stock_prices) > 30:
+        older_data = stock_prices[:-30:5]
+    else:
+        older_data = stock_prices[:-10:5] if len(stock_prices) > 10 else stock_prices[:-1:5] if len(stock_prices) > 1 else stock_prices[:0]
+    
+    # All recent 30 days with volume
+    recent_data = stock_prices[-30:] if len(stock_prices) >= 30 else stock_prices[-10:] if len(stock_prices) >= 10 else stock_prices
+    
+    return older_data, recent_data
+
+def write_historical_data(path: str, sp500_data: np.ndarray, tickers: List[str],
+                          bars_by_ticker: Dict[str, np.ndarray], ipo_dates: List[Optional[str]]):
+    """Write SPY and every ranked stock's downsampled history as one long (symbol, day) Parquet table"""
+    updated_at = datetime.now().isoformat()
+    series = [('SPY', sp500_data, None)] + [
+        (ticker, bars_by_ticker[ticker], ipo_dates[i]) for i, ticker in enumerate(tickers)
+    ]
+    
+    symbols, ipo_column, times, closes, volumes = [], [], [], [], []
+    for symbol, bars, ipo_date in series:
+        older_data, recent_data = split_minimal_history(bars)
+        count = len(older_data) + len(recent_data)
+        
+        symbols.extend([symbol] * count)
+        ipo_column.extend([ipo_date] * count)
+        times += [older_data['t'], recent_data['t']]
+        closes += [older_data['c'], recent_data['c']]
+        # Older downsampled days carry no volume
+        volumes += [np.full(len(older_data), np.nan), recent_data['v']]
+    
+    row_count = len(symbols)
+    volume = np.concatenate(volumes)
+    no_values = pa.nulls(row_count, pa.float64())  # weekly bars only keep close and volume
+    table = pa.table({
+        's': symbols,
+        't': np.concatenate(times),
+        'o': no_values,
+        'h': no_values,
+        'l': no_values,
+        'c': np.concatenate(closes),
+        'v': pa.array(volume, mask=np.isnan(volume)),
+        'u': [updated_at] * row_count,
+        'i': ipo_column
+    }, schema=HISTORY_SCHEMA)
+    
+    table = table.replace_schema_metadata({'u': updated_at, 'n': str(len(tickers))})
+    pq.write_table(table, f"{path}.tmp", compression='zstd')
+    os.replace(f"{path}.tmp", path)
+
+async def main():
     print("=== IBD-Style Relative Strength Stock Processor (WEEKLY FULL REBUILD) ===")
     print("Formula: RS = 2×(3m relative) + 6m + 9m + 12m relative performance vs S&P 500")
     print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -363,242 +800,195 @@ def main():
         print("ERROR: POLYGON_API_KEY not found!")
         return
     
-    # Date range for historical data
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=450)  # Extra buffer for weekends/holidays
-    
-    start_date_str = start_date.strftime('%Y-%m-%d')
-    end_date_str = end_date.strftime('%Y-%m-%d')
-    
-    print(f"Date range: {start_date_str} to {end_date_str}")
-    
-    # Get S&P 500 benchmark first
-    sp500_data = get_sp500_benchmark(start_date_str, end_date_str)
-    if not sp500_data:
-        print("ERROR: Failed to get S&P 500 benchmark data!")
-        return
-    
-    print(f"✅ Got {len(sp500_data)} days of S&P 500 benchmark data")
-    
-    # Get all tickers
-    tickers = get_all_tickers()
-    if not tickers:
-        print("ERROR: Failed to get tickers!")
-        return
-    
-    print(f"\nProcessing {len(tickers)} stocks...")
-    
-    all_stock_data = []
-    historical_stocks = []
-    processed = 0
-    failed = 0
-    
-    for i, ticker in enumerate(tickers):
-        try:
-            # Progress indicator every 100 stocks
-            if i % 100 == 0:
-                print(f"Progress: {i}/{len(tickers)} ({i/len(tickers)*100:.1f}%) - Processed: {processed}, Failed: {failed}")
-            
-            # Get historical data
-            stock_prices = get_stock_data(ticker, start_date_str, end_date_str)
-            
-            if stock_prices:
-                result = calculate_aligned_returns(stock_prices, sp500_data)
-                if result[0] is not None:
-                    relative_returns, stock_returns, avg_volume = result
-                    rs_score = calculate_ibd_rs_score(relative_returns)
-                    
-                    # Get IPO date
-                    ipo_date = get_ipo_date(ticker)
-                    
-                    all_stock_data.append({
-                        'symbol': ticker,
-                        'rs_score': rs_score,
-                        'avg_volume': int(avg_volume),
-                        'relative_3m': relative_returns['3m'],
-                        'relative_6m': relative_returns['6m'], 
-                        'relative_9m': relative_returns['9m'],
-                        'relative_12m': relative_returns['12m'],
-                        'stock_return_3m': stock_returns['3m'],
-                        'stock_return_12m': stock_returns['12m'],
-                        'ipo_date': ipo_date
-                    })
-                    
-                    # Store minimal historical data
-                    minimal_history = []
-                    
-                    # Every 5th day for older data (excluding recent 30)
-                    if len(stock_prices) > 30:
-                        older_data = stock_prices[:-30:5]
-                    else:
-                        older_data = stock_prices[:-10:5] if len(stock_prices) > 10 else stock_prices[:-1:5] if len(stock_prices) > 1 else []
-                    
-                    for price in older_data:
-                        minimal_history.append({
-                            't': price['t'],
-                            'c': price['c']
-                        })
-                    
-                    # All recent 30 days with volume
-                    recent_data = stock_prices[-30:] if len(stock_prices) >= 30 else stock_prices[-10:] if len(stock_prices) >= 10 else stock_prices
-                    for price in recent_data:
-                        minimal_history.append({
-                            't': price['t'],
-                            'c': price['c'],
-                            'v': price['v']
-                        })
-                    
-                    historical_stocks.append({
-                        's': ticker,
-                        'h': minimal_history,
-                        'u': datetime.now().isoformat(),
-                        'i': ipo_date
-                    })
-                    
-                    processed += 1
-                else:
-                    failed += 1
-            else:
-                failed += 1
-            
-            # Rate limiting - 2 calls per second
-            time.sleep(0.5)
-            
-        except Exception as e:
-            print(f"Error processing {ticker}: {e}")
-            failed += 1
-            continue
-    
-    print(f"\n✅ Processing complete!")
-    print(f"   Successfully processed: {processed} stocks")
-    print(f"   Failed: {failed} stocks")
-    
-    # Calculate percentile rankings
-    if all_stock_data:
-        print("\nCalculating RS percentile rankings (1-99)...")
-        
-        all_stock_data.sort(key=lambda x: x['rs_score'], reverse=True)
-        
-        total_stocks = len(all_stock_data)
-        for i, stock in enumerate(all_stock_data):
-            percentile = int(((total_stocks - i) / total_stocks) * 99) + 1
-            stock['rs_rank'] = min(percentile, 99)
-        
-        # Format for output
-        output_data = []
-        for stock in all_stock_data:
-            output_data.append({
-                'symbol': stock['symbol'],
-                'rs_rank': stock['rs_rank'],
-                'rs_score': round(stock['rs_score'], 4),
-                'avg_volume': format_volume(stock['avg_volume']),
-                'raw_volume': stock['avg_volume'],
-                'relative_3m': format_return(stock['relative_3m']),
-                'relative_6m': format_return(stock['relative_6m']),
-                'relative_9m': format_return(stock['relative_9m']),
-                'relative_12m': format_return(stock['relative_12m']),
-                'stock_return_3m': format_return(stock['stock_return_3m']),
-                'stock_return_12m': format_return(stock['stock_return_12m']),
-                'ipo_date': stock.get('ipo_date')
-            })
-        
-        # Save rankings.json
-        rankings_output = {
-            'last_updated': datetime.now().isoformat(),
-            'formula_used': 'RS = 2×(3m relative vs S&P500) + 6m + 9m + 12m relative performance',
-            'total_stocks': len(output_data),
-            'benchmark': 'S&P 500 (SPY)',
-            'update_type': 'full_rebuild',
-            'data': output_data
-        }
+    # One pooled session for the whole run so TCP/TLS connections are reused across calls
+    connector = aiohttp.TCPConnector(limit=CONNECTION_LIMIT, limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                                     keepalive_timeout=KEEPALIVE_TIMEOUT, ttl_dns_cache=DNS_CACHE_TTL)
+    timeout = aiohttp.ClientTimeout(sock_connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        # Date range for historical data
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=450)  # Extra buffer for weekends/holidays
         
-        with open('rankings.json', 'w') as f:
-            json.dump(rankings_output, f, indent=2)
+        start_date_str = start_date.strftime('%Y-%m-%d')
+        end_date_str = end_date.strftime('%Y-%m-%d')
         
-        print(f"✅ Saved {len(output_data)} stocks to 'rankings.json'")
+        print(f"Date range: {start_date_str} to {end_date_str}")
         
-        # Save historical_data.json
-        minimal_spy_data = []
-        if len(sp500_data) > 30:
-            older_spy = sp500_data[:-30:5]
-            recent_spy = sp500_data[-30:]
-        else:
-            older_spy = sp500_data[:-10:5] if len(sp500_data) > 10 else sp500_data[:-1:5] if len(sp500_data) > 1 else []
-            recent_spy = sp500_data[-10:] if len(sp500_data) >= 10 else sp500_data
-        
-        for bar in older_spy:
-            minimal_spy_data.append({'t': bar['t'], 'c': bar['c']})
-        for bar in recent_spy:
-            minimal_spy_data.append({'t': bar['t'], 'c': bar['c'], 'v': bar['v']})
-        
-        historical_output = {
-            'u': datetime.now().isoformat(),
-            's': minimal_spy_data,
-            'n': len(historical_stocks),
-            'd': historical_stocks
-        }
+        # Days that have left the window are never read again
+        pruned = prune_grouped_cache(start_date_str)
+        if pruned:
+            print(f"Removed {pruned} cached days before {start_date_str}")
         
-        with open('historical_data.json', 'w') as f:
-            json.dump(historical_output, f, indent=2)
+        # Get all tickers
+        ticker_listing = await get_all_tickers(session)
+        if not ticker_listing:
+            print("ERROR: Failed to get tickers!")
+            return
         
-        print(f"✅ Historical data saved ({len(historical_stocks)} stocks)")
+        # Skip tickers listed too recently to have 12 months of history
+        listed = [info for info in ticker_listing if has_enough_history(info['list_date'], end_date)]
+        tickers = [info['ticker'] for info in listed]
+        print(f"Skipping {len(ticker_listing) - len(tickers)} tickers listed less than {MIN_LISTING_DAYS} days ago")
         
-        # Show top 20 performers
-        print(f"\n🏆 Top 20 RS Rankings:")
-        print("Rank | Symbol | RS | 3M Rel | 12M Rel | Volume")
-        print("-" * 60)
-        for i, stock in enumerate(output_data[:20]):
-            print(f"{i+1:2d}   | {stock['symbol']:6s} | {stock['rs_rank']:2d} | {stock['relative_3m']:7s} | {stock['relative_12m']:8s} | {stock['avg_volume']:>8s}")
+        # Days cached by earlier runs are reused, so only new days are downloaded
+        cached_since = get_grouped_cache_saved_at(get_trading_days(start_date_str, end_date_str))
+        update_type = 'full_rebuild' if cached_since is None else 'incremental'
         
-        # Statistics
-        rs_scores = [s['rs_score'] for s in all_stock_data]
-        print(f"\n📊 RS Score Statistics:")
-        print(f"   Highest: {max(rs_scores):.3f}")
-        print(f"   Lowest: {min(rs_scores):.3f}")
-        print(f"   Average: {np.mean(rs_scores):.3f}")
-        print(f"   Median: {np.median(rs_scores):.3f}")
+        # Cached days hold pre-split prices, so patch in adjusted bars before anything reads them
+        # (listed tickers, SPY and the recent IPOs all come from the full listing)
+        all_tickers = [info['ticker'] for info in ticker_listing] + ['SPY']
+        if not await refresh_split_tickers(session, all_tickers, start_date_str, end_date_str, cached_since):
+            print("ERROR: Failed to check stock splits for cached bars!")
+            return
         
-        high_rs_count = len([s for s in output_data if s['rs_rank'] >= 90])
-        print(f"   Stocks with RS ≥ 90: {high_rs_count}")
-    else:
-        print("❌ No stock data was successfully processed!")
-    
-    # PROCESS RECENT IPOs
-    print("\n" + "="*60)
-    recent_ipos = get_recent_ipos()
-    
-    if recent_ipos:
-        processed_ipos = process_recent_ipos(recent_ipos)
+        # Get every ticker's history (and the S&P 500 benchmark) from grouped daily bars
+        bars_by_ticker = await get_grouped_bars(session, start_date_str, end_date_str, tickers + ['SPY'])
+        if bars_by_ticker is None:
+            print("ERROR: Failed to get grouped daily bars!")
+            return
         
-        # Sort by IPO date (newest first)
-        processed_ipos.sort(key=lambda x: x['ipo_date'], reverse=True)
+        sp500_data = bars_by_ticker.get('SPY', np.empty(0, dtype=BAR_DTYPE))
+        if len(sp500_data) == 0:
+            print("ERROR: Failed to get S&P 500 benchmark data!")
+            return
         
-        # Save recent_ipos.json
-        ipo_output = {
-            'last_updated': datetime.now().isoformat(),
-            'total_recent_ipos': len(processed_ipos),
-            'lookback_days': 90,
-            'note': 'Stocks that completed IPO in the last 90 days (status: priced or new). May not have RS scores due to insufficient history.',
-            'data': processed_ipos
-        }
+        print(f"✅ Got {len(sp500_data)} days of S&P 500 benchmark data")
         
-        with open('recent_ipos.json', 'w') as f:
-            json.dump(ipo_output, f, indent=2)
+        if len(sp500_data) < RETURN_PERIODS['12m']:
+            print("ERROR: Not enough S&P 500 history for 12-month returns!")
+            return
         
-        print(f"\n✅ Saved {len(processed_ipos)} recent IPOs to 'recent_ipos.json'")
+        print(f"\nProcessing {len(tickers)} stocks...")
         
-        # Show most recent IPOs
-        if processed_ipos:
-            print(f"\n🆕 Most Recent IPOs:")
-            print("Symbol | Company | IPO Date | Days | Price | Change")
-            print("-" * 70)
-            for ipo in processed_ipos[:10]:
-                change_str = f"{ipo['percent_from_ipo']:+.1f}%" if ipo['percent_from_ipo'] is not None else "N/A"
-                print(f"{ipo['symbol']:6s} | {ipo['company_name'][:20]:20s} | {ipo['ipo_date']} | {ipo['days_since_ipo']:3d}d | ${ipo['current_price']:6.2f} | {change_str}")
-    else:
-        print("⚠️  No completed IPOs found in the last 90 days")
+        closes, volumes, bar_counts = build_price_matrix(bars_by_ticker, tickers, sp500_data)
+        
+        # Need at least 252 trading days (roughly 12 months)
+        valid = np.flatnonzero(bar_counts >= RETURN_PERIODS['12m'])
+        ranked_tickers = [tickers[i] for i in valid]
+        
+        # The ticker listing already carries list_date, so no per-ticker detail lookups are needed
+        ipo_dates = [listed[i]['list_date'] for i in valid]
+        
+        relative_returns, stock_returns, rs_scores, avg_volumes = calculate_relative_strength(
+            closes[valid], volumes[valid], sp500_data['c'])
+        
+        processed = len(ranked_tickers)
+        failed = len(tickers) - processed
+        
+        print(f"\n✅ Processing complete!")
+        print(f"   Successfully processed: {processed} stocks")
+        print(f"   Failed: {failed} stocks")
+        
+        # Calculate percentile rankings
+        if ranked_tickers:
+            print("\nCalculating RS percentile rankings (1-99)...")
+            
+            order, rs_ranks = calculate_rs_ranks(rs_scores)
+            
+            # Convert each column to Python values once, then emit rows best-first
+            ranks = rs_ranks.tolist()
+            scores = rs_scores.tolist()
+            volumes_list = avg_volumes.astype(np.int64).tolist()
+            relative = {period_name: np.round(values, 4).tolist() for period_name, values in relative_returns.items()}
+            returns_3m = np.round(stock_returns['3m'], 4).tolist()
+            returns_12m = np.round(stock_returns['12m'], 4).tolist()
+            
+            # Raw numbers only; formatting is left to the frontend
+            output_data = []
+            for i in order.tolist():
+                output_data.append({
+                    'symbol': ranked_tickers[i],
+                    'rs_rank': ranks[i],
+                    'rs_score': round(scores[i], 4),
+                    'raw_volume': volumes_list[i],
+                    'relative_3m': relative['3m'][i],
+                    'relative_6m': relative['6m'][i],
+                    'relative_9m': relative['9m'][i],
+                    'relative_12m': relative['12m'][i],
+                    'stock_return_3m': returns_3m[i],
+                    'stock_return_12m': returns_12m[i],
+                    'ipo_date': ipo_dates[i]
+                })
+            
+            # Save rankings.json
+            rankings_output = {
+                'last_updated': datetime.now().isoformat(),
+                'formula_used': 'RS = 2×(3m relative vs S&P500) + 6m + 9m + 12m relative performance',
+                'total_stocks': len(output_data),
+                'benchmark': 'S&P 500 (SPY)',
+                'update_type': update_type,
+                'data': output_data
+            }
+            
+            with open('rankings.json', 'wb') as f:
+                f.write(orjson.dumps(rankings_output, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+            
+            print(f"✅ Saved {len(output_data)} stocks to 'rankings.json'")
+            
+            # Save historical_data.parquet
+            write_historical_data(HISTORY_PATH, sp500_data, ranked_tickers, bars_by_ticker, ipo_dates)
+            
+            # The rebuilt history already covers every day in the daily delta log, so start it over
+            open(HISTORY_DELTA_PATH, 'wb').close()
+            
+            print(f"✅ Historical data saved ({len(ranked_tickers)} stocks)")
+            
+            # Show top 20 performers
+            print(f"\n🏆 Top 20 RS Rankings:")
+            print("Rank | Symbol | RS | 3M Rel | 12M Rel | Volume")
+            print("-" * 60)
+            for i, stock in enumerate(output_data[:20]):
+                print(f"{i+1:2d}   | {stock['symbol']:6s} | {stock['rs_rank']:2d} | {format_return(stock['relative_3m']):7s} | {format_return(stock['relative_12m']):8s} | {format_volume(stock['raw_volume']):>8s}")
+            
+            # Statistics
+            print(f"\n📊 RS Score Statistics:")
+            print(f"   Highest: {rs_scores.max():.3f}")
+            print(f"   Lowest: {rs_scores.min():.3f}")
+            print(f"   Average: {rs_scores.mean():.3f}")
+            print(f"   Median: {np.median(rs_scores):.3f}")
+            
+            high_rs_count = int(np.count_nonzero(rs_ranks >= 90))
+            print(f"   Stocks with RS ≥ 90: {high_rs_count}")
+        else:
+            print("❌ No stock data was successfully processed!")
+        
+        # PROCESS RECENT IPOs
+        print("\n" + "="*60)
+        recent_ipos = await get_recent_ipos(session)
+        
+        if recent_ipos:
+            processed_ipos = await process_recent_ipos(session, recent_ipos)
+            
+            # Sort by IPO date (newest first)
+            processed_ipos.sort(key=lambda x: x['ipo_date'], reverse=True)
+            
+            # Save recent_ipos.json
+            ipo_output = {
+                'last_updated': datetime.now().isoformat(),
+                'total_recent_ipos': len(processed_ipos),
+                'lookback_days': 90,
+                'note': 'Stocks that completed IPO in the last 90 days (status: priced or new). May not have RS scores due to insufficient history.',
+                'data': processed_ipos
+            }
+            
+            with open('recent_ipos.json', 'wb') as f:
+                f.write(orjson.dumps(ipo_output, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+            
+            print(f"\n✅ Saved {len(processed_ipos)} recent IPOs to 'recent_ipos.json'")
+            
+            # Show most recent IPOs
+            if processed_ipos:
+                print(f"\n🆕 Most Recent IPOs:")
+                print("Symbol | Company | IPO Date | Days | Price | Change")
+                print("-" * 70)
+                for ipo in processed_ipos[:10]:
+                    change_str = f"{ipo['percent_from_ipo']:+.1f}%" if ipo['percent_from_ipo'] is not None else "N/A"
+                    print(f"{ipo['symbol']:6s} | {ipo['company_name'][:20]:20s} | {ipo['ipo_date']} | {ipo['days_since_ipo']:3d}d | ${ipo['current_price']:6.2f} | {change_str}")
+        else:
+            print("⚠️  No completed IPOs found in the last 90 days")
     
+    print(f"\n💾 Cache: {CACHE_STATS['hits']} hits, {CACHE_STATS['misses']} misses")
     print(f"\n✅ Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
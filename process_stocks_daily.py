@@ -1,15 +1,18 @@
 """
 ARTIFACT 2 (REVERTED): process_stocks_daily.py
 Daily Stock Data Update Script
-Updates yesterday's OHLC data for all stocks in historical_data.json
+Updates yesterday's OHLC data for all stocks in historical_data.parquet
 Runs Monday-Thursday at 4:05 PM EST
 """
 
 import os
-import json
-import requests
-import time
+import random
+import asyncio
+import aiohttp
+import orjson
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 
@@ -17,6 +20,68 @@ from typing import Dict, List, Any, Optional
 API_KEY = os.environ.get('POLYGON_API_KEY')
 BASE_URL = 'https://api.polygon.io'
 
+# Trading-day lookbacks for each RS period
+RETURN_PERIODS = {
+    '3m': 63,
+    '6m': 126,
+    '9m': 189,
+    '12m': 252
+}
+PERIOD_OFFSETS = np.array(list(RETURN_PERIODS.values()))
+
+# HTTP settings
+REQUEST_TIMEOUT = 10  # seconds to connect / between reads, so a stalled response is retried instead of hanging
+
+# Retry policy for throttled (429) / transient server and network failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+BACKOFF_JITTER = 0.5
+
+# historical_data.parquet: one row per (symbol, day), each symbol's rows contiguous and oldest first
+HISTORY_PATH = 'historical_data.parquet'
+HISTORY_DAYS = 365  # rolling window kept per symbol
+HISTORY_DELTA_PATH = 'historical_delta.jsonl'  # one line of bars per daily run since the last weekly rebuild
+HISTORY_SCHEMA = pa.schema([
+    ('s', pa.string()),
+    ('t', pa.int64()),
+    ('o', pa.float64()),
+    ('h', pa.float64()),
+    ('l', pa.float64()),
+    ('c', pa.float64()),
+    ('v', pa.float64()),
+    ('u', pa.string()),
+    ('i', pa.string())
+])
+
+def get_backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Seconds to wait before a retry: honor Retry-After, else exponential backoff with jitter"""
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, BACKOFF_JITTER)
+        except ValueError:
+            pass
+    return min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt) + random.uniform(0, BACKOFF_JITTER)
+
+async def fetch_json(session: aiohttp.ClientSession, url: str, params: Optional[Dict] = None) -> Dict:
+    """GET a Polygon endpoint, retrying transient failures"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with session.get(url, params=params) as response:
+                if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    response.raise_for_status()
+                    return orjson.loads(await response.read())
+                
+                delay = get_backoff_delay(attempt, response.headers.get('Retry-After'))
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+            # Dropped connections and timeouts are safe to retry - every call is a GET
+            if attempt == MAX_RETRIES:
+                raise
+            delay = get_backoff_delay(attempt)
+        
+        await asyncio.sleep(delay)
+
 def get_previous_trading_day() -> str:
     """Get the previous trading day (skip weekends)"""
     today = datetime.now()
@@ -32,93 +97,146 @@ def get_previous_trading_day() -> str:
     
     return previous_day.strftime('%Y-%m-%d')
 
-def get_daily_bar(ticker: str, date: str) -> Optional[Dict]:
-    """Fetch single day's OHLC data"""
+async def get_grouped_daily(session: aiohttp.ClientSession, date: str) -> Optional[Dict[str, Dict]]:
+    """Fetch every US stock's OHLC for one date in a single call, keyed by ticker"""
     try:
-        url = f"{BASE_URL}/v1/open-close/{ticker}/{date}"
+        url = f"{BASE_URL}/v2/aggs/grouped/locale/us/market/stocks/{date}"
         params = {'adjusted': 'true', 'apiKey': API_KEY}
         
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = await fetch_json(session, url, params)
         
-        if data.get('status') == 'OK':
-            # Convert to same format as historical data
-            return {
-                't': int(datetime.strptime(date, '%Y-%m-%d').timestamp() * 1000),
-                'o': data.get('open'),
-                'h': data.get('high'),
-                'l': data.get('low'),
-                'c': data.get('close'),
-                'v': data.get('volume', 0)
+        # Convert to same format as historical data
+        timestamp = int(datetime.strptime(date, '%Y-%m-%d').timestamp() * 1000)
+        return {
+            row['T']: {
+                't': timestamp,
+                'o': row.get('o'),
+                'h': row.get('h'),
+                'l': row.get('l'),
+                'c': row.get('c'),
+                'v': row.get('v', 0)
             }
-        
-        return None
+            for row in data.get('results') or []
+        }
     except Exception as e:
+        print(f"Error fetching grouped daily bars for {date}: {e}")
         return None
 
-def calculate_return_from_history(history: List[Dict], days_back: int) -> Optional[float]:
-    """Calculate return from historical data"""
-    if len(history) < days_back:
-        return None
+def read_history(path: str) -> tuple:
+    """Load historical_data.parquet as NumPy columns (nulls become NaN / None) plus its file metadata"""
+    table = pq.read_table(path)
+    metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+    columns = {name: table.column(name).to_numpy(zero_copy_only=False) for name in HISTORY_SCHEMA.names}
+    return metadata, columns
+
+def read_history_deltas(path: str) -> List[Dict]:
+    """Daily updates logged since the last weekly rebuild, oldest first"""
+    try:
+        with open(path, 'rb') as f:
+            return [orjson.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def append_history_delta(path: str, update_date: str, updated_at: str, bars: Dict[str, Dict]):
+    """Log one day's bars as a single line instead of rewriting the Parquet history"""
+    with open(path, 'ab') as f:
+        f.write(orjson.dumps({'d': update_date, 'u': updated_at, 'b': bars}) + b'\n')
+
+def group_rows_by_symbol(symbol_column: np.ndarray) -> tuple:
+    """Symbols in file order, and each row's index into them"""
+    new_run = np.r_[True, symbol_column[1:] != symbol_column[:-1]] if len(symbol_column) else np.empty(0, dtype=bool)
+    return symbol_column[new_run], np.cumsum(new_run) - 1
+
+def append_daily_bars(history: Dict[str, np.ndarray], group_ids: np.ndarray, symbols: np.ndarray,
+                      daily_bars: Dict[str, Dict], updated_at: str) -> tuple:
+    """Append each symbol's new bar and keep its last HISTORY_DAYS rows, as whole-column operations
     
-    end_price = history[-1]['c']
-    start_price = history[-days_back]['c']
+    Returns the new columns, each row's symbol index, each row's position from the end of its
+    symbol's history (1 = newest), and which symbols got a new bar.
+    """
+    new_bars = [daily_bars.get(symbol) for symbol in symbols.tolist()]
+    updated = np.array([bar is not None for bar in new_bars], dtype=bool)
+    new_ids = np.flatnonzero(updated)
+    added = [new_bars[i] for i in new_ids.tolist()]
     
-    return (end_price - start_price) / start_price
-
-def calculate_aligned_returns_from_history(stock_history: List[Dict], sp500_history: List[Dict]) -> tuple:
-    """Calculate returns from historical data"""
-    if not stock_history or not sp500_history:
-        return None, None, 0
-    
-    if len(stock_history) < 252:
-        return None, None, 0
-    
-    periods = {
-        '3m': 63,
-        '6m': 126,
-        '9m': 189,
-        '12m': 252
+    new_rows = {
+        's': symbols[new_ids],
+        't': np.array([bar['t'] for bar in added], dtype=np.int64),
+        'u': np.full(len(added), updated_at, dtype=object),
+        'i': history['i'][np.searchsorted(group_ids, new_ids)]  # carried over from the symbol's first row
     }
+    for name in ('o', 'h', 'l', 'c', 'v'):
+        new_rows[name] = np.array([bar[name] for bar in added], dtype=np.float64)
     
-    stock_returns = {}
-    sp500_returns = {}
-    relative_returns = {}
+    # Updated symbols get the new timestamp on all of their rows
+    history['u'] = np.where(updated[group_ids], updated_at, history['u'])
     
-    for period_name, days in periods.items():
-        stock_ret = calculate_return_from_history(stock_history, days)
-        sp500_ret = calculate_return_from_history(sp500_history, days)
-        
-        if stock_ret is not None and sp500_ret is not None:
-            stock_returns[period_name] = stock_ret
-            sp500_returns[period_name] = sp500_ret
-            relative_returns[period_name] = stock_ret - sp500_ret
-        else:
-            stock_returns[period_name] = 0
-            sp500_returns[period_name] = 0
-            relative_returns[period_name] = 0
+    # A stable sort on symbol index puts each new bar after that symbol's existing rows
+    ids = np.concatenate([group_ids, new_ids])
+    order = np.argsort(ids, kind='stable')
+    ids = ids[order]
+    
+    ends = np.cumsum(np.bincount(ids, minlength=len(symbols)))
+    from_end = ends[ids] - np.arange(len(ids))
+    keep = from_end <= HISTORY_DAYS
+    
+    rows = order[keep]
+    columns = {name: np.concatenate([history[name], new_rows[name]])[rows] for name in HISTORY_SCHEMA.names}
+    return columns, ids[keep], from_end[keep], updated
+
+def build_history_matrix(rows: np.ndarray, from_end: np.ndarray, closes: np.ndarray,
+                         volumes: np.ndarray, row_count: int) -> tuple:
+    """Scatter bars into right-aligned (stocks x days) matrices, NaN-padded on the left"""
+    width = int(from_end.max()) if len(from_end) else 0
+    
+    close_matrix = np.full((row_count, width), np.nan)
+    volume_matrix = np.full((row_count, width), np.nan)
+    close_matrix[rows, width - from_end] = closes
+    volume_matrix[rows, width - from_end] = volumes
+    
+    return close_matrix, volume_matrix
+
+def calculate_period_returns(closes: np.ndarray) -> np.ndarray:
+    """Return over each RS period along the last axis of closes (NaN where history is too short)"""
+    returns = np.full(closes.shape[:-1] + (len(PERIOD_OFFSETS),), np.nan)
+    available = PERIOD_OFFSETS <= closes.shape[-1]
+    if available.any():
+        starts = closes[..., -PERIOD_OFFSETS[available]]
+        returns[..., available] = (closes[..., -1:] - starts) / starts
+    return returns
+
+def calculate_aligned_returns_from_history(closes: np.ndarray, volumes: np.ndarray,
+                                           sp500_returns: np.ndarray) -> tuple:
+    """Calculate every stock's returns from the history matrices in one pass"""
+    # Periods the benchmark can't cover count as zero, same as before
+    stock_returns = calculate_period_returns(closes)
+    missing = np.isnan(stock_returns) | np.isnan(sp500_returns)
+    stock_returns[missing] = 0
+    relative_returns = np.where(missing, 0, stock_returns - sp500_returns)
     
     # Calculate average volume over last 50 days
-    recent_with_volume = [p for p in stock_history if 'v' in p][-50:]
-    volumes = [p['v'] for p in recent_with_volume]
-    avg_volume = np.mean(volumes) if volumes else 0
+    avg_volumes = volumes[:, -50:].mean(axis=1) if volumes.shape[1] else np.zeros(len(volumes))
     
-    return relative_returns, stock_returns, avg_volume
+    return relative_returns, stock_returns, avg_volumes
 
-def calculate_ibd_rs_score(relative_returns: Dict) -> float:
-    """Calculate IBD-style RS score"""
-    if not relative_returns:
-        return 0
-    
-    rs_score = (
-        2 * relative_returns.get('3m', 0) +
-        1 * relative_returns.get('6m', 0) +
-        1 * relative_returns.get('9m', 0) +
-        1 * relative_returns.get('12m', 0)
+def calculate_ibd_rs_scores(relative_returns: np.ndarray) -> np.ndarray:
+    """Calculate IBD-style RS scores from a (stocks x periods) relative-return matrix"""
+    return (
+        2 * relative_returns[:, 0] +
+        relative_returns[:, 1] +
+        relative_returns[:, 2] +
+        relative_returns[:, 3]
     )
+
+def calculate_rs_ranks(rs_scores: np.ndarray) -> tuple:
+    """Rank RS scores as 1-99 percentiles; also returns the best-first ordering"""
+    total_stocks = len(rs_scores)
+    order = np.argsort(-rs_scores, kind='stable')
+    positions = np.empty(total_stocks, dtype=np.int64)
+    positions[order] = np.arange(total_stocks)
     
-    return rs_score
+    percentiles = np.floor((total_stocks - positions) / total_stocks * 99).astype(np.int64) + 1
+    return order, np.minimum(percentiles, 99)
 
 def format_volume(volume: float) -> str:
     """Format volume as XXXk or XXXm"""
@@ -133,7 +251,7 @@ def format_return(return_val: float) -> str:
     """Format return as percentage"""
     return f"{return_val*100:.1f}%"
 
-def main():
+async def main():
     print("=== Daily Stock Data Update ===")
     print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
@@ -147,142 +265,108 @@ def main():
     
     # Load historical data
     try:
-        with open('historical_data.json', 'r') as f:
-            historical_data = json.load(f)
+        metadata, history = read_history(HISTORY_PATH)
     except FileNotFoundError:
-        print("ERROR: historical_data.json not found! Run weekly refresh first.")
+        print("ERROR: historical_data.parquet not found! Run weekly refresh first.")
         return
     
-    print(f"Loaded historical data for {historical_data['n']} stocks")
+    symbols, group_ids = group_rows_by_symbol(history['s'])
+    is_spy = symbols == 'SPY'
+    stock_count = int(metadata.get('n', np.count_nonzero(~is_spy)))
+    print(f"Loaded historical data for {stock_count} stocks")
+    
+    # Replay the days logged since the weekly rebuild on top of the Parquet base
+    deltas = read_history_deltas(HISTORY_DELTA_PATH)
+    for delta in deltas:
+        history, group_ids, _, _ = append_daily_bars(history, group_ids, symbols, delta['b'], delta['u'])
+    if deltas:
+        print(f"Replayed {len(deltas)} daily updates from {HISTORY_DELTA_PATH}")
+    
+    # A single grouped-daily call returns the new bar for SPY and every stock
+    timeout = aiohttp.ClientTimeout(sock_connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        print(f"\nFetching grouped daily bars for {update_date}...")
+        daily_bars = await get_grouped_daily(session, update_date)
+    
+    if daily_bars is None:
+        print("ERROR: Could not fetch grouped daily bars for update date!")
+        return
     
     # Update S&P 500 benchmark first
     print("\nUpdating S&P 500 benchmark...")
-    spy_bar = get_daily_bar('SPY', update_date)
     
-    if not spy_bar:
+    if not daily_bars.get('SPY'):
         print("ERROR: Could not fetch S&P 500 data for update date!")
         return
     
-    # Add new SPY bar and maintain rolling window
-    sp500_data = historical_data['s']
-    sp500_data.append(spy_bar)
-    
-    # Keep only last ~365 days of data
-    if len(sp500_data) > 365:
-        sp500_data = sp500_data[-365:]
-    
-    historical_data['s'] = sp500_data
-    print(f"✅ Updated S&P 500 ({len(sp500_data)} days of data)")
+    # Append every symbol's new bar (SPY included) and trim each to the rolling window
+    updated_at = datetime.now().isoformat()  # one update time for every stock in this run
+    history, group_ids, from_end, updated = append_daily_bars(history, group_ids, symbols, daily_bars, updated_at)
     
-    # Update all stocks
-    print(f"\nUpdating {len(historical_data['d'])} stocks...")
+    sp500_closes = history['c'][is_spy[group_ids]]
+    print(f"✅ Updated S&P 500 ({len(sp500_closes)} days of data)")
     
-    updated_stocks = []
-    failed_updates = 0
-    
-    for i, stock_data in enumerate(historical_data['d']):
-        ticker = stock_data['s']
-        
-        try:
-            if i % 100 == 0:
-                print(f"Progress: {i}/{len(historical_data['d'])} ({i/len(historical_data['d'])*100:.1f}%)")
-            
-            # Fetch new bar
-            new_bar = get_daily_bar(ticker, update_date)
-            
-            if new_bar:
-                # Add new bar to history
-                stock_history = stock_data['h']
-                stock_history.append(new_bar)
-                
-                # Keep rolling 365-day window
-                if len(stock_history) > 365:
-                    stock_history = stock_history[-365:]
-                
-                stock_data['h'] = stock_history
-                stock_data['u'] = datetime.now().isoformat()
-                
-                updated_stocks.append(stock_data)
-            else:
-                # Keep existing data if update fails
-                updated_stocks.append(stock_data)
-                failed_updates += 1
-            
-            # Rate limiting
-            time.sleep(0.5)
-            
-        except Exception as e:
-            print(f"Error updating {ticker}: {e}")
-            updated_stocks.append(stock_data)
-            failed_updates += 1
-            continue
-    
-    historical_data['d'] = updated_stocks
-    historical_data['u'] = datetime.now().isoformat()
+    # Stocks without a bar for the update date keep their existing data
+    print(f"\nUpdating {stock_count} stocks...")
+    failed_updates = int(np.count_nonzero(~updated & ~is_spy))
     
     print(f"\n✅ Stock updates complete!")
-    print(f"   Successfully updated: {len(updated_stocks) - failed_updates}")
+    print(f"   Successfully updated: {np.count_nonzero(~is_spy) - failed_updates}")
     print(f"   Failed: {failed_updates}")
     
     # Recalculate RS scores for all stocks
     print("\nRecalculating RS scores...")
     
-    all_stock_data = []
+    # Benchmark returns are the same for every stock, so compute them once
+    sp500_returns = calculate_period_returns(sp500_closes)
     
-    for stock_data in updated_stocks:
-        ticker = stock_data['s']
-        stock_history = stock_data['h']
-        
-        # Reconstruct full history with close prices
-        full_history = [{'c': bar['c'], 'v': bar.get('v', 0), 't': bar['t']} for bar in stock_history]
-        sp500_full = [{'c': bar['c'], 'v': bar.get('v', 0), 't': bar['t']} for bar in sp500_data]
-        
-        result = calculate_aligned_returns_from_history(full_history, sp500_full)
-        
-        if result[0] is not None:
-            relative_returns, stock_returns, avg_volume = result
-            rs_score = calculate_ibd_rs_score(relative_returns)
-            
-            all_stock_data.append({
-                'symbol': ticker,
-                'rs_score': rs_score,
-                'avg_volume': int(avg_volume),
-                'relative_3m': relative_returns['3m'],
-                'relative_6m': relative_returns['6m'],
-                'relative_9m': relative_returns['9m'],
-                'relative_12m': relative_returns['12m'],
-                'stock_return_3m': stock_returns['3m'],
-                'stock_return_12m': stock_returns['12m'],
-                'ipo_date': stock_data.get('i')
-            })
+    # Only stocks with 12 months of bars are ranked, so only their rows go into the matrices
+    lengths = np.bincount(group_ids, minlength=len(symbols))
+    ranked_groups = np.flatnonzero((lengths >= RETURN_PERIODS['12m']) & ~is_spy)
+    matrix_row = np.full(len(symbols), -1)
+    matrix_row[ranked_groups] = np.arange(len(ranked_groups))
+    in_matrix = matrix_row[group_ids] >= 0
+    
+    # Bars without a volume count as zero volume, as before
+    closes, volumes = build_history_matrix(matrix_row[group_ids[in_matrix]], from_end[in_matrix],
+                                           history['c'][in_matrix], np.nan_to_num(history['v'][in_matrix]),
+                                           len(ranked_groups))
+    ranked_symbols = symbols[ranked_groups].tolist()
+    ranked_ipo_dates = history['i'][np.searchsorted(group_ids, ranked_groups)].tolist()
+    
+    relative_matrix, stock_matrix, avg_volumes = calculate_aligned_returns_from_history(closes, volumes, sp500_returns)
+    rs_scores = calculate_ibd_rs_scores(relative_matrix)
     
     # Calculate percentile rankings
-    if all_stock_data:
+    if ranked_symbols:
         print("Calculating RS percentile rankings...")
         
-        all_stock_data.sort(key=lambda x: x['rs_score'], reverse=True)
+        order, rs_ranks = calculate_rs_ranks(rs_scores)
         
-        total_stocks = len(all_stock_data)
-        for i, stock in enumerate(all_stock_data):
-            percentile = int(((total_stocks - i) / total_stocks) * 99) + 1
-            stock['rs_rank'] = min(percentile, 99)
+        # Convert to Python values once, then emit rows best-first
+        ranks = rs_ranks.tolist()
+        scores = rs_scores.tolist()
+        volumes_list = avg_volumes.astype(np.int64).tolist()
+        relative_rows = relative_matrix.tolist()
+        stock_rows = stock_matrix.tolist()
         
-        # Format for output
+        # Raw numbers only; formatting is left to the frontend
         output_data = []
-        for stock in all_stock_data:
+        for row in order.tolist():
+            relative_3m, relative_6m, relative_9m, relative_12m = relative_rows[row]
+            stock_return_3m, _, _, stock_return_12m = stock_rows[row]
             output_data.append({
-                'symbol': stock['symbol'],
-                'rs_rank': stock['rs_rank'],
-                'rs_score': round(stock['rs_score'], 4),
-                'avg_volume': format_volume(stock['avg_volume']),
-                'raw_volume': stock['avg_volume'],
-                'relative_3m': format_return(stock['relative_3m']),
-                'relative_6m': format_return(stock['relative_6m']),
-                'relative_9m': format_return(stock['relative_9m']),
-                'relative_12m': format_return(stock['relative_12m']),
-                'stock_return_3m': format_return(stock['stock_return_3m']),
-                'stock_return_12m': format_return(stock['stock_return_12m']),
-                'ipo_date': stock.get('ipo_date')
+                'symbol': ranked_symbols[row],
+                'rs_rank': ranks[row],
+                'rs_score': round(scores[row], 4),
+                'raw_volume': volumes_list[row],
+                'relative_3m': round(relative_3m, 4),
+                'relative_6m': round(relative_6m, 4),
+                'relative_9m': round(relative_9m, 4),
+                'relative_12m': round(relative_12m, 4),
+                'stock_return_3m': round(stock_return_3m, 4),
+                'stock_return_12m': round(stock_return_12m, 4),
+                'ipo_date': ranked_ipo_dates[row]
             })
         
         # Save rankings.json
@@ -295,27 +379,27 @@ def main():
             'data': output_data
         }
         
-        with open('rankings.json', 'w') as f:
-            json.dump(rankings_output, f, indent=2)
+        with open('rankings.json', 'wb') as f:
+            f.write(orjson.dumps(rankings_output, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
         
         print(f"✅ Updated rankings.json with {len(output_data)} stocks")
         
-        # Save historical_data.json
-        with open('historical_data.json', 'w') as f:
-            json.dump(historical_data, f, indent=2)
+        # Log today's bars; the weekly refresh folds them into historical_data.parquet
+        append_history_delta(HISTORY_DELTA_PATH, update_date, updated_at,
+                             {symbol: daily_bars[symbol] for symbol in symbols[updated].tolist()})
         
-        print(f"✅ Updated historical_data.json")
+        print(f"✅ Logged {int(np.count_nonzero(updated))} new bars to {HISTORY_DELTA_PATH}")
         
         # Show top 10
         print(f"\n🏆 Top 10 RS Rankings:")
         print("Rank | Symbol | RS | 3M Rel | Volume")
         print("-" * 45)
         for i, stock in enumerate(output_data[:10]):
-            print(f"{i+1:2d}   | {stock['symbol']:6s} | {stock['rs_rank']:2d} | {stock['relative_3m']:7s} | {stock['avg_volume']:>8s}")
+            print(f"{i+1:2d}   | {stock['symbol']:6s} | {stock['rs_rank']:2d} | {format_return(stock['relative_3m']):7s} | {format_volume(stock['raw_volume']):>8s}")
         
         print(f"\n✅ Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     else:
         print("❌ No stock data was successfully processed!")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())